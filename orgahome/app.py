@@ -69,6 +69,10 @@ def lifespan_factory(static_files: staticfiles.StaticFilesBase):
         templates.env.filters["from_iso"] = lambda x: datetime.datetime.fromisoformat(x)
         templates.env.filters["friendly_date"] = _friendly_date
         templates.env.filters["color_hash"] = _color_hash
+        if not app.debug:
+            templates.env.auto_reload = False
+            for template_name in templates.env.list_templates():
+                templates.env.get_template(template_name)
 
         async with (
             aiohttp.ClientSession() as session,
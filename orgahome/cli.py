@@ -1,5 +1,5 @@
 import logging
-import multiprocessing
+import os
 import pathlib
 import shutil
 
@@ -13,7 +13,7 @@ def cli():
 
 
 def default_workers() -> int:
-    return (multiprocessing.cpu_count() * 2) + 1
+    return ((os.process_cpu_count() or 1) * 2) + 1
 
 
 @cli.command("uvicorn")
@@ -2,29 +2,38 @@
 
 import abc
 import base64
+import functools
 import hashlib
+import io
 import json
 import os
 import pathlib
-import re
 import typing
 from collections.abc import Collection, Iterable
 
 import jinja2
 import jinja2.runtime
 from starlette import staticfiles
+from starlette.datastructures import Headers
 from starlette.requests import Request
+from starlette.responses import FileResponse, Response
 from starlette.templating import Jinja2Templates
+from starlette.types import Scope
 
 STATIC_SOURCE_PATH = pathlib.Path(__file__).parent / "static"
 STATIC_COMPILED_PATH = pathlib.Path(__file__).parent / "dist"
 MANIFEST_FILENAME = ".staticmanifest.json"
+MANIFEST_VERSION = 1
 
-FILENAME_HASH_FUNC = hashlib.sha256
+# SRI hashes must stay SHA-256 for browsers; filename hashes only need to bust caches.
+FILENAME_HASH_FUNC = functools.partial(hashlib.blake2b, digest_size=16)
 FILENAME_HASH_LEN = FILENAME_HASH_FUNC().digest_size * 2
 
 
 class StaticFilesBase(abc.ABC):
+    # Whether hash_path and get_sri_hash always return the same result for a given file.
+    immutable: typing.ClassVar[bool] = False
+
     def __init__(self, static_route: str = "static"):
         self.static_route = static_route
 
@@ -35,7 +44,7 @@ class StaticFilesBase(abc.ABC):
             return request.url_for(self.static_route, path=self.hash_path(path))
 
         templates.env.globals["static_url_for"] = static_url_for
-        templates.env.globals["static_sri_hash"] = lambda path: self.get_sri_hash(path)
+        templates.env.globals["static_sri_hash"] = self.get_sri_hash
 
     @abc.abstractmethod
     def hash_path(self, file: str) -> str | None:
@@ -49,32 +58,86 @@ class StaticFilesBase(abc.ABC):
     def get_sri_hash(self, file: str) -> str | None:
         pass
 
+    def hashed_path_sri_hash(self, path: str) -> str | None:
+        return None
+
+
+_HASH_BUFFER_SIZE = 2**18
+
+
+class FileDigests(typing.NamedTuple):
+    filename: bytes
+    sri: bytes
+
+
+def _digest_file(f: io.BufferedIOBase) -> FileDigests:
+    filename_hasher = FILENAME_HASH_FUNC()
+    sri_hasher = hashlib.sha256()
+    buf = bytearray(_HASH_BUFFER_SIZE)
+    view = memoryview(buf)
+    while size := f.readinto(buf):
+        filename_hasher.update(view[:size])
+        sri_hasher.update(view[:size])
+    return FileDigests(filename=filename_hasher.digest(), sri=sri_hasher.digest())
+
+
+@functools.lru_cache(maxsize=512)
+def _cached_digest(path: str, mtime_ns: int, size: int) -> FileDigests:
+    # mtime_ns and size are only part of the cache key, so that edited files are rehashed.
+    with open(path, "rb") as f:
+        return _digest_file(f)
+
+
+def _hash_file(path: str) -> FileDigests:
+    stat = os.stat(path)
+    return _cached_digest(path, stat.st_mtime_ns, stat.st_size)
+
+
+def _digest_to_hashed_filename(file: str, digest: bytes) -> str:
+    root, ext = os.path.splitext(file)
+    return f"{root}.{digest.hex()}{ext}"
+
+
+def _digest_to_sri_hash(digest: bytes) -> str:
+    return f"sha256-{base64.b64encode(digest).decode('utf-8')}"
+
+
+def hashed_filename(root: str, file: str) -> str:
+    return _digest_to_hashed_filename(file, _hash_file(os.path.join(root, file)).filename)
+
 
-def hashed_filename(root: pathlib.Path, file: pathlib.PurePath) -> pathlib.PurePath:
-    filehash = FILENAME_HASH_FUNC((root / file).read_bytes()).hexdigest()
-    return file.with_stem(f"{file.stem}.{filehash}")
+_HEX_DIGITS = frozenset("0123456789abcdef")
 
 
-HASHED_STEM_REGEX = re.compile(r"^(.*)[.][a-z0-9]{" + str(FILENAME_HASH_LEN) + "}$")
+def unhashed_stem(stem: str) -> str | None:
+    if len(stem) <= FILENAME_HASH_LEN or stem[-FILENAME_HASH_LEN - 1] != ".":
+        return None
+    if not _HEX_DIGITS.issuperset(stem[-FILENAME_HASH_LEN:]):
+        return None
+    return stem[: -FILENAME_HASH_LEN - 1]
 
 
-def sri_hash(root: pathlib.Path, file: pathlib.PurePath) -> str:
-    filehash = hashlib.sha256((root / file).read_bytes()).digest()
-    return f"sha256-{base64.b64encode(filehash).decode('utf-8')}"
+def unhashed_path(path: str) -> str | None:
+    root, ext = os.path.splitext(path)
+    original_root = unhashed_stem(root)
+    if original_root is None:
+        return None
+    return original_root + ext
 
 
-def lookup_path(
-    directories: Iterable[pathlib.Path], filenames: Collection[pathlib.PurePath]
-) -> tuple[str, os.stat_result | None] | None:
+def sri_hash(root: str, file: str) -> str:
+    return _digest_to_sri_hash(_hash_file(os.path.join(root, file)).sri)
+
+
+def lookup_path(directories: Iterable[str], filenames: Collection[str]) -> tuple[str, os.stat_result | None] | None:
     for directory in directories:
         for filename in filenames:
-            disk_path = directory / filename
-            if not disk_path.is_relative_to(directory):
+            disk_path = os.path.normpath(os.path.join(directory, filename))
+            if os.path.commonpath([directory, disk_path]) != directory:
                 return None  # misbehaving client
             try:
-                stat = disk_path.stat()
-                return str(disk_path), stat
-            except FileNotFoundError:
+                return disk_path, os.stat(disk_path)
+            except FileNotFoundError, NotADirectoryError:
                 continue
     return None
 
@@ -83,48 +146,56 @@ class DevelopmentStaticFiles(StaticFilesBase):
     def __init__(self, static_dir: pathlib.Path = STATIC_SOURCE_PATH, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.static_dir = static_dir
+        self._static_root = os.path.abspath(static_dir)
 
     def get_serving_directories(self) -> list[pathlib.Path]:
         return [self.static_dir]
 
-    def resolve_path(self, file: str) -> pathlib.PurePath | None:
-        resolved_path = self.static_dir.joinpath(file)
-        try:
-            relative_path = resolved_path.relative_to(self.static_dir)
-        except ValueError:
+    def resolve_path(self, file: str) -> str | None:
+        full_path = os.path.normpath(os.path.join(self._static_root, file))
+        if os.path.commonpath([self._static_root, full_path]) != self._static_root:
             return None
-        if not resolved_path.exists():
+        if not os.path.isfile(full_path):
             return None
-        return relative_path
+        return full_path[len(self._static_root) + 1 :]
 
     def hash_path(self, file: str) -> str | None:
         resolved_path = self.resolve_path(file)
         if not resolved_path:
             return None
-        return str(hashed_filename(self.static_dir, resolved_path))
+        return hashed_filename(self._static_root, resolved_path)
 
     def hashed_path_to_file(self, path: str) -> tuple[str, os.stat_result | None] | None:
-        file = pathlib.PurePath(path)
-        file_candidates: list[pathlib.PurePath] = [file]
+        file_candidates = [path]
 
-        re_match = HASHED_STEM_REGEX.search(file.stem)
-        if re_match:
-            file_candidates.append(file.with_stem(re_match.group(1)))
-        return lookup_path([self.static_dir], file_candidates)
+        original_path = unhashed_path(path)
+        if original_path is not None:
+            file_candidates.append(original_path)
+        return lookup_path([self._static_root], file_candidates)
 
     def get_sri_hash(self, file: str) -> str | None:
         resolved_path = self.resolve_path(file)
         if not resolved_path:
             return None
-        return sri_hash(self.static_dir, resolved_path)
+        return sri_hash(self._static_root, resolved_path)
 
 
-class ManifestEntry(typing.TypedDict):
+class ManifestEntry(typing.NamedTuple):
     hashed_path: str
     sri_hash: str
 
 
+@functools.lru_cache(maxsize=8)
+def _cached_manifest(path: str, mtime_ns: int) -> dict[str, ManifestEntry]:
+    manifest = json.loads(pathlib.Path(path).read_bytes())
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Static manifest {path} is not version {MANIFEST_VERSION}; rerun compilestatic")
+    return {file: ManifestEntry(**entry) for file, entry in manifest["files"].items()}
+
+
 class ManifestStaticFiles(StaticFilesBase):
+    immutable = True
+
     def __init__(
         self,
         static_dir: pathlib.Path = STATIC_SOURCE_PATH,
@@ -135,23 +206,56 @@ class ManifestStaticFiles(StaticFilesBase):
         super().__init__(*args, **kwargs)
         self.static_dir = static_dir
         self.serving_dir = serving_dir
+        self._static_root = os.path.abspath(static_dir)
+        self._serving_roots = [os.path.abspath(serving_dir), self._static_root]
         self.manifest = self.load_manifest()
+        self.hashed_manifest = {entry.hashed_path: entry for entry in self.manifest.values()}
+        self.hashed_files = {
+            hashed_path: os.path.join(self._serving_roots[0], hashed_path) for hashed_path in self.hashed_manifest
+        }
 
     def get_serving_directories(self) -> list[pathlib.Path]:
         return [self.serving_dir, self.static_dir]
 
     def load_manifest(self) -> dict[str, ManifestEntry]:
-        with open(self.serving_dir / MANIFEST_FILENAME) as f:
-            return json.load(f)
+        manifest_path = self.serving_dir / MANIFEST_FILENAME
+        return _cached_manifest(str(manifest_path), manifest_path.stat().st_mtime_ns)
 
     def hash_path(self, file: str) -> str | None:
-        return self.manifest.get(file, {}).get("hashed_path")
+        entry = self.manifest.get(file)
+        return entry.hashed_path if entry else None
 
     def hashed_path_to_file(self, path: str) -> tuple[str, os.stat_result | None] | None:
-        return lookup_path([self.serving_dir, self.static_dir], [pathlib.PurePath(path)])
+        disk_path = self.hashed_files.get(path)
+        if disk_path:
+            try:
+                return disk_path, os.stat(disk_path)
+            except FileNotFoundError:
+                pass
+        if path in self.manifest:
+            return lookup_path([self._static_root], [path])
+        return lookup_path(self._serving_roots, [path])
 
     def get_sri_hash(self, file: str) -> str | None:
-        return self.manifest.get(file, {}).get("sri_hash")
+        entry = self.manifest.get(file)
+        return entry.sri_hash if entry else None
+
+    def hashed_path_sri_hash(self, path: str) -> str | None:
+        entry = self.hashed_manifest.get(path)
+        return entry.sri_hash if entry else None
+
+
+def _compile_static_file(
+    source_path: pathlib.Path, dest_path: pathlib.Path, relative_path: pathlib.PurePath
+) -> tuple[str, ManifestEntry]:
+    filepath = source_path / relative_path
+    with open(filepath, "rb") as source:
+        digests = _digest_file(source)
+    hashed_name = _digest_to_hashed_filename(str(relative_path), digests.filename)
+    target_filepath = dest_path / hashed_name
+    target_filepath.parent.mkdir(parents=True, exist_ok=True)
+    filepath.copy(target_filepath)
+    return str(relative_path), ManifestEntry(hashed_path=hashed_name, sri_hash=_digest_to_sri_hash(digests.sri))
 
 
 def compile_static_files(
@@ -160,17 +264,22 @@ def compile_static_files(
     manifest = {}
     for dirpath, dirnames, filenames in source_path.walk():
         for filename in filenames:
-            filepath = dirpath / filename
-            relative_to_source_root = pathlib.PurePath(filepath.relative_to(source_path))
-            hashed_name = hashed_filename(source_path, relative_to_source_root)
-            manifest[str(relative_to_source_root)] = ManifestEntry(
-                hashed_path=str(hashed_name), sri_hash=sri_hash(source_path, relative_to_source_root)
-            )
-            target_filepath = dest_path / hashed_name
-            target_filepath.parent.mkdir(parents=True, exist_ok=True)
-            filepath.copy(target_filepath)
+            relative_path = pathlib.PurePath((dirpath / filename).relative_to(source_path))
+            file, entry = _compile_static_file(source_path, dest_path, relative_path)
+            manifest[file] = entry
     with open(dest_path / MANIFEST_FILENAME, "w") as f:
-        json.dump(manifest, f, indent=2)
+        json.dump(
+            {"version": MANIFEST_VERSION, "files": {file: entry._asdict() for file, entry in manifest.items()}},
+            f,
+            indent=2,
+        )
+
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def immutable_headers(sri: str) -> dict[str, str]:
+    return {"cache-control": IMMUTABLE_CACHE_CONTROL, "etag": f'"{sri}"'}
 
 
 class StaticFilesServer(staticfiles.StaticFiles):
@@ -178,8 +287,34 @@ class StaticFilesServer(staticfiles.StaticFiles):
         self.static_files = static_files
         super().__init__()
 
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        request_headers = Headers(scope=scope)
+        if self.static_files.immutable and scope["method"] in ("GET", "HEAD") and "if-none-match" in request_headers:
+            sri = self.static_files.hashed_path_sri_hash(path)
+            if sri is not None:
+                headers = Headers(immutable_headers(sri))
+                if self.is_not_modified(headers, request_headers):
+                    return staticfiles.NotModifiedResponse(headers)
+        return await super().get_response(path, scope)
+
     def lookup_path(self, path: str) -> tuple[str, os.stat_result | None]:
         result = self.static_files.hashed_path_to_file(path)
         if not result:
             return "", None
         return result
+
+    def file_response(
+        self, full_path: os.PathLike[str] | str, stat_result: os.stat_result, scope: Scope, status_code: int = 200
+    ) -> Response:
+        if not self.static_files.immutable:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        sri = self.static_files.hashed_path_sri_hash(self.get_path(scope))
+        if sri is None:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        headers = immutable_headers(sri)
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return staticfiles.NotModifiedResponse(response.headers)
+        return response
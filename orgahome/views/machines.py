@@ -1,5 +1,6 @@
 import asyncio
 import dataclasses
+import operator
 
 from starlette.requests import Request
 from starlette.responses import Response
@@ -7,7 +8,7 @@ from starlette.responses import Response
 from orgahome import puppetdb
 
 
-@dataclasses.dataclass(frozen=True)
+@dataclasses.dataclass(frozen=True, slots=True)
 class CombinedInfo:
     inventory: puppetdb.PuppetInventoryHost
     emf_info: puppetdb.EMFPuppetInfo | None
@@ -24,28 +25,33 @@ class CombinedInfo:
 
 async def machines(request: Request) -> Response:
     puppetdb_client: puppetdb.BasePuppetDBClient = request.state.puppetdb_client
-    inventory_task = puppetdb_client.query_inventory()
-    emf_info_task = puppetdb_client.query_emf_info()
-    nodes_task = puppetdb_client.query_nodes()
-    catalogs_task = puppetdb_client.query_catalogs()
-    websites_task = puppetdb_client.query_websites()
-    inventory, emf_info, nodes_list, catalogs_list, websites = await asyncio.gather(
-        inventory_task, emf_info_task, nodes_task, catalogs_task, websites_task
-    )
-    nodes = {node["certname"]: node for node in nodes_list}
-    catalogs = {catalog["certname"]: catalog for catalog in catalogs_list}
-
-    inventory.sort(key=lambda host: host["certname"])
-    combined_info = [
+    async with asyncio.TaskGroup() as tg:
+        inventory_task = tg.create_task(puppetdb_client.query_inventory())
+        emf_info_task = tg.create_task(puppetdb_client.query_emf_info())
+        nodes_task = tg.create_task(puppetdb_client.query_nodes())
+        catalogs_task = tg.create_task(puppetdb_client.query_catalogs())
+        websites_task = tg.create_task(puppetdb_client.query_websites())
+    inventory = inventory_task.result()
+    emf_info = emf_info_task.result()
+    websites = websites_task.result()
+    nodes = {node["certname"]: node for node in nodes_task.result()}
+    catalogs = {catalog["certname"]: catalog for catalog in catalogs_task.result()}
+
+    inventory.sort(key=operator.itemgetter("certname"))
+    emf_info_get = emf_info.get
+    nodes_get = nodes.get
+    catalogs_get = catalogs.get
+    websites_get = websites.get
+    combined_info = (
         CombinedInfo(
             inventory=host,
-            emf_info=emf_info.get(host["certname"]),
-            node=nodes.get(host["certname"]),
-            catalog=catalogs.get(host["certname"]),
-            websites=websites.get(host["certname"], []),
+            emf_info=emf_info_get(host["certname"]),
+            node=nodes_get(host["certname"]),
+            catalog=catalogs_get(host["certname"]),
+            websites=websites_get(host["certname"], []),
         )
         for host in inventory
-    ]
+    )
 
     return request.state.templates.TemplateResponse(
         request,